@@ -1,11 +1,13 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, date, timedelta
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
+import httpx
 import plotly.express as px
 from fpdf import FPDF
-import base64
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 # -------------------- Error Handling Wrapper --------------------
 def safe_supabase_call(func, *args, **kwargs):
@@ -16,6 +18,12 @@ def safe_supabase_call(func, *args, **kwargs):
     except Exception as e:
         return None, True, str(e)
 
+def safe_supabase_calls_parallel(*funcs):
+    """Run independent Supabase calls concurrently and return their (result, error_flag, error_msg) tuples in order."""
+    with ThreadPoolExecutor(max_workers=len(funcs)) as ex:
+        futures = [ex.submit(safe_supabase_call, func) for func in funcs]
+        return [f.result() for f in futures]
+
 # -------------------- Supabase Initialization --------------------
 @st.cache_resource
 def init_supabase():
@@ -24,7 +32,14 @@ def init_supabase():
     if not url or not key:
         st.error("Supabase credentials missing. Please set SUPABASE_URL and SUPABASE_KEY in secrets.")
         st.stop()
-    return create_client(url, key)
+    # Give the client a pooled keep-alive HTTP client so concurrent reads reuse warm connections
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+        timeout=10.0,
+        follow_redirects=True,
+        http2=True,
+    )
+    return create_client(url, key, options=ClientOptions(httpx_client=http_client))
 
 supabase = init_supabase()
 
@@ -50,6 +65,18 @@ def init_session():
         'current_shift_name': None,
         'current_date': date.today(),
         'page': 'Dashboard',
+        # Rows entered on Shift Recording but not yet saved (flushed with one bulk insert)
+        'expense_rows': [],
+        'payment_rows': [],
+        'purchase_rows': [],
+        'return_rows': [],
+        'withdrawal_rows': [],
+        # Shifts whose stored expected_cash is stale (recomputed lazily, see flush_expected_cash)
+        'expected_dirty': set(),
+        # Last loaded shift row and the (shift_id, shift_version) it was loaded for
+        'shift_info': None,
+        'shift_info_key': None,
+        'shift_version': 0,
     }
     for key, val in defaults.items():
         if key not in st.session_state:
@@ -82,201 +109,509 @@ def generate_pdf(title, df, columns, totals_row=None, filename="report.pdf"):
     pdf.cell(0, 10, title, 0, 1, "C")
     pdf.ln(5)
 
-    pdf.set_font("Arial", "B", 10)
-    col_width = pdf.w / (len(columns) + 1) if len(columns) < 8 else 25
-    # Header
-    for col in columns:
-        pdf.cell(col_width, 8, col, 1, 0, "C")
-    pdf.ln()
-
-    # Data
-    pdf.set_font("Arial", "", 9)
-    for _, row in df.iterrows():
+    # Stringify the whole table once instead of boxing every row into a Series;
+    # missing values (including Arrow-backed NA) print as empty cells
+    rows = df.reindex(columns=columns).astype(object).fillna("").astype(str).values.tolist()
+    body_rows = len(rows)
+    if totals_row:
+        rows.append(["TOTAL"] + [str(totals_row.get(col, "")) for col in columns[1:]])
+    aligns = ["R" if col == "amount" else "L" for col in columns]
+
+    col_width = pdf.epw / len(columns)
+    row_height = 8
+    x0 = pdf.l_margin
+    table_width = col_width * len(columns)
+
+    def draw_grid(top, bottom):
+        # One outline plus shared row/column rules per page instead of a box per cell
+        pdf.rect(x0, top, table_width, bottom - top)
+        for i in range(1, round((bottom - top) / row_height)):
+            y = top + i * row_height
+            pdf.line(x0, y, x0 + table_width, y)
+        for i in range(1, len(columns)):
+            x = x0 + i * col_width
+            pdf.line(x, top, x, bottom)
+
+    def header():
+        pdf.set_font("Arial", "B", 10)
         for col in columns:
-            val = str(row[col]) if col in row else ""
-            pdf.cell(col_width, 8, val[:30], 1, 0, "L" if col != "amount" else "R")
+            pdf.cell(col_width, row_height, col, 0, 0, "C")
         pdf.ln()
-
-    # Totals row if provided
-    if totals_row:
-        pdf.set_font("Arial", "B", 9)
-        for i, col in enumerate(columns):
-            if i == 0:
-                pdf.cell(col_width, 8, "TOTAL", 1, 0, "L")
-            else:
-                val = totals_row.get(col, "")
-                pdf.cell(col_width, 8, str(val), 1, 0, "R" if col == "amount" else "L")
+        pdf.set_font("Arial", "", 9)
+
+    top = pdf.get_y()
+    header()
+    for i, row in enumerate(rows):
+        if pdf.get_y() + row_height > pdf.page_break_trigger:
+            draw_grid(top, pdf.get_y())
+            pdf.add_page()
+            top = pdf.get_y()
+            header()
+        if i == body_rows:
+            pdf.set_font("Arial", "B", 9)
+        for val, align in zip(row, aligns):
+            pdf.cell(col_width, row_height, val[:30], 0, 0, align)
         pdf.ln()
+    draw_grid(top, pdf.get_y())
 
-    return pdf.output(dest="S").encode("latin1")
+    return bytes(pdf.output())
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_pdf(title, df, columns, totals_row=None):
+    """Build report PDF bytes once per distinct report contents; keep the most recent 16."""
+    return generate_pdf(title, df, columns, totals_row)
+
+def pdf_download_button(label, file_name, title, df, columns, totals_row=None):
+    """Offer a report as a PDF download. A PDF that can't be built is reported without hiding the report."""
+    try:
+        data = cached_pdf(title, df, columns, totals_row)
+    except Exception as e:
+        st.download_button(label, data=b"", file_name=file_name, disabled=True)
+        st.error(f"PDF export failed: {e}")
+        return
+    st.download_button(label, data=data, file_name=file_name, mime="application/pdf")
+
+# -------------------- Paginated Table Helper --------------------
+def show_paginated_dataframe(df, key, page_size=100):
+    """Render only one page of a large DataFrame so reruns don't serialize the whole frame."""
+    if len(df) <= page_size:
+        st.dataframe(df, use_container_width=True)
+        return
+    num_pages = (len(df) - 1) // page_size + 1
+    page = st.number_input(f"Page (1-{num_pages})", min_value=1, max_value=num_pages, value=1, step=1, key=key)
+    start = (page - 1) * page_size
+    st.dataframe(df.iloc[start:start + page_size], use_container_width=True)
+    st.caption(f"Showing rows {start + 1}-{min(start + page_size, len(df))} of {len(df)}")
 
 # -------------------- Helper Functions (with safe calls) --------------------
+# Heads and vendors change rarely; cache them across reruns. The loaders raise on
+# failure so errors are reported by the callers below and never cached.
+@st.cache_data(ttl="5m", max_entries=4, show_spinner=False)
+def _load_expense_heads():
+    return pd.DataFrame(supabase.table("expense_heads").select("id, name, description").execute().data)
+
+@st.cache_data(ttl="5m", max_entries=4, show_spinner=False)
+def _load_vendors():
+    return pd.DataFrame(supabase.table("vendors").select("id, name, contact, opening_balance").execute().data)
+
+def invalidate_heads():
+    _load_expense_heads.clear()
+
+def invalidate_vendors():
+    _load_vendors.clear()
+
 def fetch_expense_heads():
-    result, err, msg = safe_supabase_call(lambda: supabase.table("expense_heads").select("*").execute())
+    result, err, msg = safe_supabase_call(_load_expense_heads)
     if err:
         st.error(f"Failed to fetch expense heads: {msg}")
         return pd.DataFrame()
-    return pd.DataFrame(result.data)
+    return result
 
 def fetch_vendors():
-    result, err, msg = safe_supabase_call(lambda: supabase.table("vendors").select("*").execute())
+    result, err, msg = safe_supabase_call(_load_vendors)
     if err:
         st.error(f"Failed to fetch vendors: {msg}")
         return pd.DataFrame()
-    return pd.DataFrame(result.data)
+    return result
 
 def fetch_shifts(date_selected):
     result, err, msg = safe_supabase_call(
-        lambda: supabase.table("shifts").select("*").eq("date", date_selected.isoformat()).execute()
+        lambda: supabase.table("shifts")
+                .select("id, shift_name, status, opening_cash, total_sale, expected_cash, closing_cash_entered")
+                .eq("date", date_selected.isoformat()).execute()
     )
     if err:
         st.error(f"Failed to fetch shifts: {msg}")
         return pd.DataFrame()
     return pd.DataFrame(result.data)
 
+# Shift Recording redraws the current shift and its entries on every widget
+# interaction. The shift row is kept per session in st.session_state, keyed by
+# (shift_id, shift_version); the entries are cached briefly. Both are dropped
+# whenever the shift changes.
+def _shift_child_frame(rows, columns, embedded=None, label=None):
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    if embedded:
+        df[label] = [x['name'] if x else None for x in df[embedded]]
+    return df[columns]
+
+def load_shift(shift_id):
+    data = supabase.table("shifts").select("date, status, opening_cash, total_sale").eq("id", shift_id).execute().data
+    return data[0] if data else None
+
+@st.cache_data(ttl="30s", max_entries=20, show_spinner=False)
+def load_shift_children(shift_id):
+    """Return (expenses, payments, purchases, returns, withdrawals) of a shift as display DataFrames."""
+    queries = [
+        supabase.table("expenses").select("amount, source, description, expense_heads(name)").eq("shift_id", shift_id),
+        supabase.table("vendor_payments").select("amount, source, description, vendors(name)").eq("shift_id", shift_id),
+        supabase.table("purchases").select("amount, payment_type, source_if_cash, description, vendors(name)")
+        .eq("shift_id", shift_id),
+        supabase.table("returns").select("amount, description, vendors(name)").eq("shift_id", shift_id),
+        supabase.table("withdrawals").select("amount, description").eq("shift_id", shift_id),
+    ]
+    # The five reads are independent; overlap their network waits
+    with ThreadPoolExecutor(max_workers=len(queries)) as ex:
+        futures = [ex.submit(q.execute) for q in queries]
+        exp, pay, pur, ret, wd = [f.result().data for f in futures]
+    return (
+        _shift_child_frame(exp, ['head', 'amount', 'source', 'description'], 'expense_heads', 'head'),
+        _shift_child_frame(pay, ['vendor', 'amount', 'source', 'description'], 'vendors', 'vendor'),
+        _shift_child_frame(pur, ['vendor', 'amount', 'payment_type', 'source_if_cash', 'description'], 'vendors', 'vendor'),
+        _shift_child_frame(ret, ['vendor', 'amount', 'description'], 'vendors', 'vendor'),
+        _shift_child_frame(wd, ['amount', 'description']),
+    )
+
+def invalidate_shift():
+    st.session_state.shift_version += 1
+    load_shift_children.clear()
+
+# get_vendor_ledger result schema, declared once so frames skip dtype inference
+_LEDGER_COLS = ['tx_date', 'tx_type', 'debit', 'credit', 'payment_mode', 'description', 'balance']
+_LEDGER_DTYPES = {
+    'tx_type': 'category',
+    'debit': 'float64',
+    'credit': 'float64',
+    'payment_mode': 'category',
+    'description': 'string[pyarrow]',
+    'balance': 'float64',
+}
+
+# Reports re-read their data on every widget interaction; keep each result for a
+# minute per (vendor, date range). Saving shift entries drops both caches.
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_vendor_ledger(vendor_id, start_iso, end_iso, include_cash=False):
+    return supabase.rpc("get_vendor_ledger", {
+        "p_vendor": vendor_id, "p_start": start_iso, "p_end": end_iso, "p_include_cash": include_cash
+    }).execute().data
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_owner_ledger(start_iso, end_iso):
+    """Return the Owner Transactions display frame, built once per date range."""
+    rows = (supabase.table("owner_ledger")
+            .select("transaction_date, amount, description")
+            .gte("transaction_date", start_iso)
+            .lte("transaction_date", end_iso)
+            .order("transaction_date")
+            .execute().data)
+    df = pd.DataFrame(rows, columns=['transaction_date', 'amount', 'description'])
+    amount = pd.to_numeric(df['amount'], errors='coerce').to_numpy(dtype='float64')
+    # A missing or non-numeric amount gets no type and doesn't break the running balance
+    missing = np.isnan(amount)
+    return pd.DataFrame({
+        'Date': df['transaction_date'],
+        'Type': pd.Categorical(np.where(missing, "", np.where(amount > 0, "Investment", "Withdrawal"))),
+        'Amount': np.abs(amount),
+        'Description': df['description'],
+        'Balance': np.nancumsum(amount),
+    })
+
+def invalidate_ledgers():
+    _load_vendor_ledger.clear()
+    _load_owner_ledger.clear()
+
 def get_or_create_shift(date_selected, shift_name):
-    # Check if exists
+    # Atomic insert-or-fetch keyed on (date, shift_name); opening cash comes from the previous shift
+    flush_expected_cash()
     result, err, msg = safe_supabase_call(
-        lambda: supabase.table("shifts").select("*")
-                .eq("date", date_selected.isoformat())
-                .eq("shift_name", shift_name)
-                .execute()
-    )
-    if err:
-        st.error(f"Shift lookup failed: {msg}")
-        return None
-    if result.data:
-        return result.data[0]['id']
-
-    # Get opening cash from previous shift
-    prev, err2, msg2 = safe_supabase_call(
-        lambda: supabase.table("shifts").select("*")
-                .eq("date", date_selected.isoformat())
-                .lt("shift_name", shift_name)
-                .order("shift_name")
-                .execute()
+        lambda: supabase.rpc("get_or_create_shift", {
+            "p_date": date_selected.isoformat(),
+            "p_shift_name": shift_name
+        }).execute()
     )
-    if err2:
-        st.error(f"Failed to get previous shift: {msg2}")
+    if err or not result.data:
+        st.error(f"Failed to open shift: {msg}")
         return None
-    opening = 0
-    if prev.data:
-        last = prev.data[-1]
-        opening = last.get('expected_cash') or last.get('closing_cash_entered') or 0
-
-    data = {
-        "date": date_selected.isoformat(),
-        "shift_name": shift_name,
-        "opening_cash": opening,
-        "total_sale": 0,
-        "status": "open"
-    }
-    ins, err3, msg3 = safe_supabase_call(lambda: supabase.table("shifts").insert(data).execute())
-    if err3:
-        st.error(f"Failed to create shift: {msg3}")
-        return None
-    return ins.data[0]['id']
+    return result.data
 
 def calculate_expected_cash(shift_id):
-    shift_res, err, msg = safe_supabase_call(lambda: supabase.table("shifts").select("*").eq("id", shift_id).execute())
-    if err or not shift_res.data:
+    # opening + sale - sales-cash outflows, computed in Postgres (see compute_expected_cash)
+    result, err, msg = safe_supabase_call(
+        lambda: supabase.rpc("compute_expected_cash", {"p_shift_id": shift_id}).execute()
+    )
+    if err or result.data is None:
         st.error(f"Shift not found: {msg}")
         return 0
-    shift = shift_res.data[0]
-    opening = shift['opening_cash'] or 0
-    sale = shift['total_sale'] or 0
-
-    # Expenses from sales cash
-    exp, err, msg = safe_supabase_call(
-        lambda: supabase.table("expenses").select("amount").eq("shift_id", shift_id).eq("source", "sales_cash").execute()
-    )
-    total_exp = sum([e['amount'] for e in exp.data]) if not err and exp.data else 0
-
-    # Vendor payments from sales cash
-    pay, err, msg = safe_supabase_call(
-        lambda: supabase.table("vendor_payments").select("amount").eq("shift_id", shift_id).eq("source", "sales_cash").execute()
-    )
-    total_pay = sum([p['amount'] for p in pay.data]) if not err and pay.data else 0
-
-    # Purchases cash from sales cash
-    pur, err, msg = safe_supabase_call(
-        lambda: supabase.table("purchases").select("amount").eq("shift_id", shift_id)
-                .eq("payment_type", "cash").eq("source_if_cash", "sales_cash").execute()
-    )
-    total_pur = sum([p['amount'] for p in pur.data]) if not err and pur.data else 0
-
-    # Withdrawals
-    wd, err, msg = safe_supabase_call(
-        lambda: supabase.table("withdrawals").select("amount").eq("shift_id", shift_id).execute()
-    )
-    total_wd = sum([w['amount'] for w in wd.data]) if not err and wd.data else 0
-
-    expected = opening + sale - (total_exp + total_pay + total_pur + total_wd)
-    return expected
+    return result.data
 
 def update_expected_cash(shift_id):
-    expected = calculate_expected_cash(shift_id)
     _, err, msg = safe_supabase_call(
-        lambda: supabase.table("shifts").update({"expected_cash": expected}).eq("id", shift_id).execute()
+        lambda: supabase.rpc("update_expected_cash", {"p_shift_id": shift_id}).execute()
     )
+    invalidate_shift()
     if err:
         st.error(f"Failed to update expected cash: {msg}")
 
-def close_shift(shift_id, closing_cash):
-    shift_res, err, msg = safe_supabase_call(lambda: supabase.table("shifts").select("*").eq("id", shift_id).execute())
-    if err or not shift_res.data:
-        st.error("Shift not found")
-        return
-    shift = shift_res.data[0]
-    expected = shift.get('expected_cash') or calculate_expected_cash(shift_id)
+def mark_expected_dirty(shift_id):
+    st.session_state.expected_dirty.add(shift_id)
 
-    if closing_cash < expected:
-        # Get shortage head
-        head_res, err, msg = safe_supabase_call(
-            lambda: supabase.table("expense_heads").select("id").eq("name", "Cash Shortage").execute()
-        )
-        if err or not head_res.data:
-            st.error("Cash Shortage head not found")
-            return
-        shortage_head = head_res.data[0]['id']
-        shortage_amt = expected - closing_cash
-        _, err2, msg2 = safe_supabase_call(
-            lambda: supabase.table("expenses").insert({
-                "shift_id": shift_id,
-                "expense_head_id": shortage_head,
-                "amount": shortage_amt,
-                "source": "sales_cash",
-                "description": "Auto-recorded cash shortage"
-            }).execute()
-        )
-        if err2:
-            st.error(f"Failed to record shortage: {msg2}")
-            return
-        update_expected_cash(shift_id)
-
-    # Close shift
-    _, err3, msg3 = safe_supabase_call(
-        lambda: supabase.table("shifts").update({
-            "closing_cash_entered": closing_cash,
-            "status": "closed",
-            "closed_at": datetime.now().isoformat()
-        }).eq("id", shift_id).execute()
-    )
-    if err3:
-        st.error(f"Failed to close shift: {msg3}")
+def flush_expected_cash():
+    """Recompute stored expected cash once for every shift changed since the last flush."""
+    for sid in st.session_state.expected_dirty:
+        update_expected_cash(sid)
+    st.session_state.expected_dirty = set()
 
-def record_owner_ledger(amount, description, shift_id=None):
+def refresh_expected_cash(start_date, end_date):
+    """Flush this session's changes, then refresh stored expected cash of open shifts in a date range."""
+    flush_expected_cash()
+    # Other sessions may have left open shifts stale; one server-side statement covers them all
     _, err, msg = safe_supabase_call(
-        lambda: supabase.table("owner_ledger").insert({
-            "transaction_date": datetime.now().isoformat(),
-            "amount": amount,
-            "description": description,
-            "shift_id": shift_id
+        lambda: supabase.rpc("refresh_expected_cash", {
+            "p_start": start_date.isoformat(),
+            "p_end": end_date.isoformat()
         }).execute()
     )
+    if err:
+        st.error(f"Failed to refresh expected cash: {msg}")
+
+def close_shift(shift_id, closing_cash):
+    """Close a shift atomically in Postgres, auto-recording any cash shortage. Returns True on success."""
+    _, err, msg = safe_supabase_call(
+        lambda: supabase.rpc("close_shift", {"p_shift_id": shift_id, "p_closing_cash": closing_cash}).execute()
+    )
+    invalidate_shift()
+    if err:
+        st.error(f"Failed to close shift: {msg}")
+        return False
+    return True
+
+def record_owner_ledger_entries(entries):
+    """Record several (amount, description, shift_id) owner ledger entries in one insert."""
+    now = datetime.now().isoformat()
+    rows = [{"transaction_date": now, "amount": amount, "description": description, "shift_id": sid}
+            for amount, description, sid in entries]
+    _, err, msg = safe_supabase_call(lambda: supabase.table("owner_ledger").insert(rows).execute())
     if err:
         st.error(f"Failed to record owner ledger: {msg}")
 
+STAGED_ROW_KEYS = ['expense_rows', 'payment_rows', 'purchase_rows', 'return_rows', 'withdrawal_rows']
+
+def clear_staged_rows():
+    for key in STAGED_ROW_KEYS:
+        st.session_state[key] = []
+
+def save_staged_rows(table, state_key, owner_entries=()):
+    """Insert every staged row for a table in one request. Returns True on success."""
+    _, err, msg = safe_supabase_call(lambda: supabase.table(table).insert(st.session_state[state_key]).execute())
+    if err:
+        st.error(f"Failed: {msg}")
+        return False
+    invalidate_shift()
+    if owner_entries:
+        record_owner_ledger_entries(owner_entries)
+    invalidate_ledgers()
+    st.session_state[state_key] = []
+    return True
+
+def show_staged_rows(state_key, label, display_df):
+    """Show unsaved rows with save/discard buttons. Returns True when the user asks to save."""
+    st.caption(f"{len(display_df)} staged {label.lower()} (not saved yet)")
+    st.dataframe(display_df, use_container_width=True)
+    col_save, col_discard = st.columns(2)
+    if col_discard.button(f"Discard Staged {label}", use_container_width=True):
+        st.session_state[state_key] = []
+        st.rerun()
+    return col_save.button(f"Save All {label}", type="primary", use_container_width=True)
+
+# -------------------- Shift Recording Sections --------------------
+# Typing in one entry form reruns just that fragment; saving a batch calls
+# st.rerun(), which refreshes the whole page (expected cash, other sections).
+@st.fragment
+def expenses_section(shift_id, df_exp):
+    st.subheader("Expenses")
+    heads_df = fetch_expense_heads()
+    if not heads_df.empty:
+        head_options = {row['name']: row['id'] for _, row in heads_df.iterrows()}
+        with st.form("expense_form"):
+            cols = st.columns(4)
+            with cols[0]:
+                head = st.selectbox("Head", list(head_options.keys()), key="exp_head")
+            with cols[1]:
+                amt = st.number_input("Amount", min_value=0.01, step=10.0, key="exp_amt")
+            with cols[2]:
+                src = st.selectbox("Source", ["sales_cash", "owner_pocket"], key="exp_src")
+            with cols[3]:
+                desc = st.text_input("Description", key="exp_desc")
+            if st.form_submit_button("Add Expense"):
+                st.session_state.expense_rows.append({
+                    "shift_id": shift_id,
+                    "expense_head_id": head_options[head],
+                    "amount": amt,
+                    "source": src,
+                    "description": desc
+                })
+
+        if st.session_state.expense_rows:
+            head_names = {v: k for k, v in head_options.items()}
+            staged = pd.DataFrame(st.session_state.expense_rows)
+            staged['head'] = staged['expense_head_id'].map(head_names)
+            if show_staged_rows("expense_rows", "Expenses", staged[['head', 'amount', 'source', 'description']]):
+                owner = [(r['amount'], f"Expense: {head_names[r['expense_head_id']]}", shift_id)
+                         for r in st.session_state.expense_rows if r['source'] == "owner_pocket"]
+                if save_staged_rows("expenses", "expense_rows", owner):
+                    mark_expected_dirty(shift_id)
+                    st.success("Expenses saved")
+                    st.rerun()
+
+        # Show existing
+        if not df_exp.empty:
+            st.dataframe(df_exp, use_container_width=True)
+
+@st.fragment
+def payments_section(shift_id, df_pay):
+    st.subheader("Vendor Payments")
+    vendors_df = fetch_vendors()
+    if not vendors_df.empty:
+        vendor_options = {row['name']: row['id'] for _, row in vendors_df.iterrows()}
+        vendor_names = {v: k for k, v in vendor_options.items()}
+        with st.form("payment_form"):
+            cols = st.columns(4)
+            with cols[0]:
+                vendor = st.selectbox("Vendor", list(vendor_options.keys()), key="pay_vendor")
+            with cols[1]:
+                amt = st.number_input("Amount", min_value=0.01, step=10.0, key="pay_amt")
+            with cols[2]:
+                src = st.selectbox("Source", ["sales_cash", "owner_pocket"], key="pay_src")
+            with cols[3]:
+                desc = st.text_input("Description", key="pay_desc")
+            if st.form_submit_button("Add Payment"):
+                st.session_state.payment_rows.append({
+                    "shift_id": shift_id,
+                    "vendor_id": vendor_options[vendor],
+                    "amount": amt,
+                    "source": src,
+                    "description": desc
+                })
+
+        if st.session_state.payment_rows:
+            staged = pd.DataFrame(st.session_state.payment_rows)
+            staged['vendor'] = staged['vendor_id'].map(vendor_names)
+            if show_staged_rows("payment_rows", "Payments", staged[['vendor', 'amount', 'source', 'description']]):
+                owner = [(r['amount'], f"Vendor Payment: {vendor_names[r['vendor_id']]}", shift_id)
+                         for r in st.session_state.payment_rows if r['source'] == "owner_pocket"]
+                if save_staged_rows("vendor_payments", "payment_rows", owner):
+                    mark_expected_dirty(shift_id)
+                    st.success("Payments saved")
+                    st.rerun()
+
+        if not df_pay.empty:
+            st.dataframe(df_pay, use_container_width=True)
+
+@st.fragment
+def purchases_section(shift_id, df_pur):
+    st.subheader("Purchases")
+    vendors_df = fetch_vendors()
+    if not vendors_df.empty:
+        vendor_options = {row['name']: row['id'] for _, row in vendors_df.iterrows()}
+        vendor_names = {v: k for k, v in vendor_options.items()}
+        with st.form("purchase_form"):
+            cols = st.columns(5)
+            with cols[0]:
+                vendor = st.selectbox("Vendor", list(vendor_options.keys()), key="pur_vendor")
+            with cols[1]:
+                amt = st.number_input("Amount", min_value=0.01, step=10.0, key="pur_amt")
+            with cols[2]:
+                pay_type = st.selectbox("Payment Type", ["cash", "credit"], key="pur_type")
+            with cols[3]:
+                src = st.selectbox("Source if Cash", ["sales_cash", "owner_pocket"],
+                                   disabled=pay_type != "cash", key="pur_src")
+            with cols[4]:
+                desc = st.text_input("Description", key="pur_desc")
+            if st.form_submit_button("Add Purchase"):
+                data = {
+                    "shift_id": shift_id,
+                    "vendor_id": vendor_options[vendor],
+                    "amount": amt,
+                    "payment_type": pay_type,
+                    # Always present so staged rows share one key set for the bulk insert
+                    "source_if_cash": src if pay_type == "cash" else None,
+                    "description": desc
+                }
+                st.session_state.purchase_rows.append(data)
+
+        if st.session_state.purchase_rows:
+            staged = pd.DataFrame(st.session_state.purchase_rows)
+            staged['vendor'] = staged['vendor_id'].map(vendor_names)
+            if show_staged_rows("purchase_rows", "Purchases",
+                                staged[['vendor', 'amount', 'payment_type', 'source_if_cash', 'description']]):
+                rows = st.session_state.purchase_rows
+                owner = [(r['amount'], f"Purchase (cash) from {vendor_names[r['vendor_id']]}", shift_id)
+                         for r in rows if r['payment_type'] == "cash" and r['source_if_cash'] == "owner_pocket"]
+                affects_cash = any(r['payment_type'] == "cash" and r['source_if_cash'] == "sales_cash" for r in rows)
+                if save_staged_rows("purchases", "purchase_rows", owner):
+                    if affects_cash:
+                        mark_expected_dirty(shift_id)
+                    st.success("Purchases saved")
+                    st.rerun()
+
+        if not df_pur.empty:
+            st.dataframe(df_pur, use_container_width=True)
+
+@st.fragment
+def returns_section(shift_id, df_ret):
+    st.subheader("Returns to Vendors")
+    vendors_df = fetch_vendors()
+    if not vendors_df.empty:
+        vendor_options = {row['name']: row['id'] for _, row in vendors_df.iterrows()}
+        vendor_names = {v: k for k, v in vendor_options.items()}
+        with st.form("return_form"):
+            cols = st.columns(3)
+            with cols[0]:
+                vendor = st.selectbox("Vendor", list(vendor_options.keys()), key="ret_vendor")
+            with cols[1]:
+                amt = st.number_input("Amount", min_value=0.01, step=10.0, key="ret_amt")
+            with cols[2]:
+                desc = st.text_input("Description", key="ret_desc")
+            if st.form_submit_button("Add Return"):
+                st.session_state.return_rows.append({
+                    "shift_id": shift_id,
+                    "vendor_id": vendor_options[vendor],
+                    "amount": amt,
+                    "description": desc
+                })
+
+        if st.session_state.return_rows:
+            staged = pd.DataFrame(st.session_state.return_rows)
+            staged['vendor'] = staged['vendor_id'].map(vendor_names)
+            if show_staged_rows("return_rows", "Returns", staged[['vendor', 'amount', 'description']]):
+                if save_staged_rows("returns", "return_rows"):
+                    st.success("Returns saved")
+                    st.rerun()
+
+        if not df_ret.empty:
+            st.dataframe(df_ret, use_container_width=True)
+
+@st.fragment
+def withdrawals_section(shift_id, df_wd):
+    st.subheader("Withdrawals (Owner takes cash)")
+    with st.form("withdrawal_form"):
+        cols = st.columns(2)
+        with cols[0]:
+            amt = st.number_input("Amount", min_value=0.01, step=10.0, key="wd_amt")
+        with cols[1]:
+            desc = st.text_input("Description", key="wd_desc")
+        if st.form_submit_button("Add Withdrawal"):
+            st.session_state.withdrawal_rows.append({
+                "shift_id": shift_id,
+                "amount": amt,
+                "description": desc
+            })
+
+    if st.session_state.withdrawal_rows:
+        staged = pd.DataFrame(st.session_state.withdrawal_rows)
+        if show_staged_rows("withdrawal_rows", "Withdrawals", staged[['amount', 'description']]):
+            owner = [(-r['amount'], f"Withdrawal: {r['description']}", shift_id)
+                     for r in st.session_state.withdrawal_rows]
+            if save_staged_rows("withdrawals", "withdrawal_rows", owner):
+                mark_expected_dirty(shift_id)
+                st.success("Withdrawals saved")
+                st.rerun()
+
+    if not df_wd.empty:
+        st.dataframe(df_wd, use_container_width=True)
+
 # -------------------- Navigation --------------------
 st.sidebar.title("🏥 Medical Store")
 pages = ["📊 Dashboard", "⚙️ Heads Setup", "📝 Shift Recording", "📈 Reports"]
@@ -291,6 +626,7 @@ if st.session_state.page == "📊 Dashboard":
         selected_date = st.date_input("Select Date", value=date.today())
     with col2:
         st.subheader(f"Summary for {selected_date}")
+    refresh_expected_cash(selected_date, selected_date)
 
     shifts = fetch_shifts(selected_date)
     if shifts.empty:
@@ -299,21 +635,18 @@ if st.session_state.page == "📊 Dashboard":
         total_sale = shifts['total_sale'].sum()
         shift_ids = shifts['id'].tolist()
 
-        # Fetch totals with safe calls
-        exp_res, err, msg = safe_supabase_call(
-            lambda: supabase.table("expenses").select("amount").in_("shift_id", shift_ids).execute()
-        )
-        total_expenses = sum([e['amount'] for e in exp_res.data]) if not err and exp_res.data else 0
-
-        wd_res, err, msg = safe_supabase_call(
-            lambda: supabase.table("withdrawals").select("amount").in_("shift_id", shift_ids).execute()
+        # Totals are summed server-side in a single round trip
+        totals_res, err, msg = safe_supabase_call(
+            lambda: supabase.rpc("dashboard_totals", {"p_shift_ids": shift_ids}).execute()
         )
-        total_withdrawals = sum([w['amount'] for w in wd_res.data]) if not err and wd_res.data else 0
-
-        pay_res, err, msg = safe_supabase_call(
-            lambda: supabase.table("vendor_payments").select("amount").in_("shift_id", shift_ids).execute()
-        )
-        total_payments = sum([p['amount'] for p in pay_res.data]) if not err and pay_res.data else 0
+        if err or not totals_res.data:
+            st.error(f"Failed to fetch totals: {msg}")
+            totals = {}
+        else:
+            totals = totals_res.data[0]
+        total_expenses = totals.get('total_expenses') or 0
+        total_withdrawals = totals.get('total_withdrawals') or 0
+        total_payments = totals.get('total_payments') or 0
 
         last_shift = shifts.iloc[-1]
         available_cash = last_shift['expected_cash'] if pd.notna(last_shift['expected_cash']) else 0
@@ -326,14 +659,15 @@ if st.session_state.page == "📊 Dashboard":
         cole.metric("Available Cash", f"₹{available_cash:,.2f}")
 
         st.subheader("Shifts Breakdown")
-        for _, shift in shifts.iterrows():
-            with st.expander(f"{shift['shift_name']} Shift - {'Closed' if shift['status']=='closed' else 'Open'}"):
-                st.write(f"Opening Cash: ₹{shift['opening_cash']:,.2f}")
-                st.write(f"Total Sale: ₹{shift['total_sale']:,.2f}")
-                exp_val = shift['expected_cash']
+        breakdown = shifts[['shift_name', 'status', 'opening_cash', 'total_sale', 'expected_cash', 'closing_cash_entered']]
+        for shift in breakdown.itertuples(index=False):
+            with st.expander(f"{shift.shift_name} Shift - {'Closed' if shift.status=='closed' else 'Open'}"):
+                st.write(f"Opening Cash: ₹{shift.opening_cash:,.2f}")
+                st.write(f"Total Sale: ₹{shift.total_sale:,.2f}")
+                exp_val = shift.expected_cash
                 st.write(f"Expected Cash: ₹{exp_val:,.2f}" if pd.notna(exp_val) else "Expected Cash: Not calculated")
-                if pd.notna(shift['closing_cash_entered']):
-                    st.write(f"Closing Cash Entered: ₹{shift['closing_cash_entered']:,.2f}")
+                if pd.notna(shift.closing_cash_entered):
+                    st.write(f"Closing Cash Entered: ₹{shift.closing_cash_entered:,.2f}")
 
 # -------------------- Heads Setup Page --------------------
 elif st.session_state.page == "⚙️ Heads Setup":
@@ -351,6 +685,7 @@ elif st.session_state.page == "⚙️ Heads Setup":
                         lambda: supabase.table("expense_heads").insert({"name": name, "description": desc}).execute()
                     )
                     if not err:
+                        invalidate_heads()
                         st.success("Added!")
                         st.rerun()
                     else:
@@ -373,6 +708,7 @@ elif st.session_state.page == "⚙️ Heads Setup":
                         }).execute()
                     )
                     if not err:
+                        invalidate_vendors()
                         st.success("Added!")
                         st.rerun()
                     else:
@@ -393,6 +729,7 @@ elif st.session_state.page == "📝 Shift Recording":
             shift_id = get_or_create_shift(st.session_state.current_date, "Morning")
             if shift_id:
                 st.session_state.current_shift_id = shift_id
+                clear_staged_rows()
                 st.rerun()
     with col2:
         if st.button("☀️ Evening Shift", use_container_width=True):
@@ -401,6 +738,7 @@ elif st.session_state.page == "📝 Shift Recording":
             shift_id = get_or_create_shift(st.session_state.current_date, "Evening")
             if shift_id:
                 st.session_state.current_shift_id = shift_id
+                clear_staged_rows()
                 st.rerun()
     with col3:
         if st.button("🌙 Night Shift", use_container_width=True):
@@ -409,18 +747,21 @@ elif st.session_state.page == "📝 Shift Recording":
             shift_id = get_or_create_shift(st.session_state.current_date, "Night")
             if shift_id:
                 st.session_state.current_shift_id = shift_id
+                clear_staged_rows()
                 st.rerun()
 
     if st.session_state.current_shift_id:
         shift_id = st.session_state.current_shift_id
-        shift_res, err, msg = safe_supabase_call(
-            lambda: supabase.table("shifts").select("*").eq("id", shift_id).execute()
-        )
-        if err or not shift_res.data:
-            st.error(f"Shift error: {msg}")
-            st.session_state.current_shift_id = None
-            st.rerun()
-        shift_info = shift_res.data[0]
+        shift_key = (shift_id, st.session_state.shift_version)
+        if st.session_state.shift_info_key != shift_key:
+            shift_info, err, msg = safe_supabase_call(load_shift, shift_id)
+            if err or not shift_info:
+                st.error(f"Shift error: {msg}")
+                st.session_state.current_shift_id = None
+                st.rerun()
+            st.session_state.shift_info = shift_info
+            st.session_state.shift_info_key = shift_key
+        shift_info = st.session_state.shift_info
 
         if shift_info['status'] == 'closed':
             st.warning("This shift is closed. You cannot edit it.")
@@ -437,219 +778,30 @@ elif st.session_state.page == "📝 Shift Recording":
                     lambda: supabase.table("shifts").update({"total_sale": new_sale}).eq("id", shift_id).execute()
                 )
                 if not err:
-                    update_expected_cash(shift_id)
+                    invalidate_shift()
+                    mark_expected_dirty(shift_id)
                     st.rerun()
                 else:
                     st.error(f"Failed to update sale: {msg}")
 
             st.markdown("---")
 
-            # ---------- Expenses ----------
-            st.subheader("Expenses")
-            heads_df = fetch_expense_heads()
-            if not heads_df.empty:
-                head_options = {row['name']: row['id'] for _, row in heads_df.iterrows()}
-                with st.form("expense_form"):
-                    cols = st.columns(4)
-                    with cols[0]:
-                        head = st.selectbox("Head", list(head_options.keys()), key="exp_head")
-                    with cols[1]:
-                        amt = st.number_input("Amount", min_value=0.01, step=10.0, key="exp_amt")
-                    with cols[2]:
-                        src = st.selectbox("Source", ["sales_cash", "owner_pocket"], key="exp_src")
-                    with cols[3]:
-                        desc = st.text_input("Description", key="exp_desc")
-                    if st.form_submit_button("Add Expense"):
-                        _, err, msg = safe_supabase_call(
-                            lambda: supabase.table("expenses").insert({
-                                "shift_id": shift_id,
-                                "expense_head_id": head_options[head],
-                                "amount": amt,
-                                "source": src,
-                                "description": desc
-                            }).execute()
-                        )
-                        if not err:
-                            if src == "owner_pocket":
-                                record_owner_ledger(amt, f"Expense: {head}", shift_id)
-                            update_expected_cash(shift_id)
-                            st.success("Expense added")
-                            st.rerun()
-                        else:
-                            st.error(f"Failed: {msg}")
-
-                # Show existing
-                exp_res, err, msg = safe_supabase_call(
-                    lambda: supabase.table("expenses").select("*, expense_heads(name)").eq("shift_id", shift_id).execute()
-                )
-                if not err and exp_res.data:
-                    df_exp = pd.DataFrame(exp_res.data)
-                    df_exp['head'] = df_exp['expense_heads'].apply(lambda x: x['name'])
-                    st.dataframe(df_exp[['head', 'amount', 'source', 'description']], use_container_width=True)
+            children, err, msg = safe_supabase_call(load_shift_children, shift_id)
+            if err:
+                st.error(f"Failed to load shift entries: {msg}")
+                children = (pd.DataFrame(),) * 5
+            df_exp, df_pay, df_pur, df_ret, df_wd = children
 
+            # Each entry section is a fragment: its widgets rerun only that section
+            expenses_section(shift_id, df_exp)
             st.markdown("---")
-
-            # ---------- Vendor Payments ----------
-            st.subheader("Vendor Payments")
-            vendors_df = fetch_vendors()
-            if not vendors_df.empty:
-                vendor_options = {row['name']: row['id'] for _, row in vendors_df.iterrows()}
-                with st.form("payment_form"):
-                    cols = st.columns(4)
-                    with cols[0]:
-                        vendor = st.selectbox("Vendor", list(vendor_options.keys()), key="pay_vendor")
-                    with cols[1]:
-                        amt = st.number_input("Amount", min_value=0.01, step=10.0, key="pay_amt")
-                    with cols[2]:
-                        src = st.selectbox("Source", ["sales_cash", "owner_pocket"], key="pay_src")
-                    with cols[3]:
-                        desc = st.text_input("Description", key="pay_desc")
-                    if st.form_submit_button("Add Payment"):
-                        _, err, msg = safe_supabase_call(
-                            lambda: supabase.table("vendor_payments").insert({
-                                "shift_id": shift_id,
-                                "vendor_id": vendor_options[vendor],
-                                "amount": amt,
-                                "source": src,
-                                "description": desc
-                            }).execute()
-                        )
-                        if not err:
-                            if src == "owner_pocket":
-                                record_owner_ledger(amt, f"Vendor Payment: {vendor}", shift_id)
-                            update_expected_cash(shift_id)
-                            st.success("Payment added")
-                            st.rerun()
-                        else:
-                            st.error(f"Failed: {msg}")
-
-                pay_res, err, msg = safe_supabase_call(
-                    lambda: supabase.table("vendor_payments").select("*, vendors(name)").eq("shift_id", shift_id).execute()
-                )
-                if not err and pay_res.data:
-                    df_pay = pd.DataFrame(pay_res.data)
-                    df_pay['vendor'] = df_pay['vendors'].apply(lambda x: x['name'])
-                    st.dataframe(df_pay[['vendor', 'amount', 'source', 'description']], use_container_width=True)
-
+            payments_section(shift_id, df_pay)
             st.markdown("---")
-
-            # ---------- Purchases ----------
-            st.subheader("Purchases")
-            if not vendors_df.empty:
-                vendor_options = {row['name']: row['id'] for _, row in vendors_df.iterrows()}
-                with st.form("purchase_form"):
-                    cols = st.columns(5)
-                    with cols[0]:
-                        vendor = st.selectbox("Vendor", list(vendor_options.keys()), key="pur_vendor")
-                    with cols[1]:
-                        amt = st.number_input("Amount", min_value=0.01, step=10.0, key="pur_amt")
-                    with cols[2]:
-                        pay_type = st.selectbox("Payment Type", ["cash", "credit"], key="pur_type")
-                    with cols[3]:
-                        src = st.selectbox("Source if Cash", ["sales_cash", "owner_pocket"],
-                                           disabled=pay_type != "cash", key="pur_src")
-                    with cols[4]:
-                        desc = st.text_input("Description", key="pur_desc")
-                    if st.form_submit_button("Add Purchase"):
-                        data = {
-                            "shift_id": shift_id,
-                            "vendor_id": vendor_options[vendor],
-                            "amount": amt,
-                            "payment_type": pay_type,
-                            "description": desc
-                        }
-                        if pay_type == "cash":
-                            data["source_if_cash"] = src
-                        _, err, msg = safe_supabase_call(
-                            lambda: supabase.table("purchases").insert(data).execute()
-                        )
-                        if not err:
-                            if pay_type == "cash" and src == "owner_pocket":
-                                record_owner_ledger(amt, f"Purchase (cash) from {vendor}", shift_id)
-                            if pay_type == "cash" and src == "sales_cash":
-                                update_expected_cash(shift_id)
-                            st.success("Purchase added")
-                            st.rerun()
-                        else:
-                            st.error(f"Failed: {msg}")
-
-                pur_res, err, msg = safe_supabase_call(
-                    lambda: supabase.table("purchases").select("*, vendors(name)").eq("shift_id", shift_id).execute()
-                )
-                if not err and pur_res.data:
-                    df_pur = pd.DataFrame(pur_res.data)
-                    df_pur['vendor'] = df_pur['vendors'].apply(lambda x: x['name'])
-                    st.dataframe(df_pur[['vendor', 'amount', 'payment_type', 'source_if_cash', 'description']], use_container_width=True)
-
+            purchases_section(shift_id, df_pur)
             st.markdown("---")
-
-            # ---------- Returns ----------
-            st.subheader("Returns to Vendors")
-            if not vendors_df.empty:
-                vendor_options = {row['name']: row['id'] for _, row in vendors_df.iterrows()}
-                with st.form("return_form"):
-                    cols = st.columns(3)
-                    with cols[0]:
-                        vendor = st.selectbox("Vendor", list(vendor_options.keys()), key="ret_vendor")
-                    with cols[1]:
-                        amt = st.number_input("Amount", min_value=0.01, step=10.0, key="ret_amt")
-                    with cols[2]:
-                        desc = st.text_input("Description", key="ret_desc")
-                    if st.form_submit_button("Add Return"):
-                        _, err, msg = safe_supabase_call(
-                            lambda: supabase.table("returns").insert({
-                                "shift_id": shift_id,
-                                "vendor_id": vendor_options[vendor],
-                                "amount": amt,
-                                "description": desc
-                            }).execute()
-                        )
-                        if not err:
-                            st.success("Return added")
-                            st.rerun()
-                        else:
-                            st.error(f"Failed: {msg}")
-
-                ret_res, err, msg = safe_supabase_call(
-                    lambda: supabase.table("returns").select("*, vendors(name)").eq("shift_id", shift_id).execute()
-                )
-                if not err and ret_res.data:
-                    df_ret = pd.DataFrame(ret_res.data)
-                    df_ret['vendor'] = df_ret['vendors'].apply(lambda x: x['name'])
-                    st.dataframe(df_ret[['vendor', 'amount', 'description']], use_container_width=True)
-
+            returns_section(shift_id, df_ret)
             st.markdown("---")
-
-            # ---------- Withdrawals ----------
-            st.subheader("Withdrawals (Owner takes cash)")
-            with st.form("withdrawal_form"):
-                cols = st.columns(2)
-                with cols[0]:
-                    amt = st.number_input("Amount", min_value=0.01, step=10.0, key="wd_amt")
-                with cols[1]:
-                    desc = st.text_input("Description", key="wd_desc")
-                if st.form_submit_button("Add Withdrawal"):
-                    _, err, msg = safe_supabase_call(
-                        lambda: supabase.table("withdrawals").insert({
-                            "shift_id": shift_id,
-                            "amount": amt,
-                            "description": desc
-                        }).execute()
-                    )
-                    if not err:
-                        record_owner_ledger(-amt, f"Withdrawal: {desc}", shift_id)
-                        update_expected_cash(shift_id)
-                        st.success("Withdrawal added")
-                        st.rerun()
-                    else:
-                        st.error(f"Failed: {msg}")
-
-            wd_res, err, msg = safe_supabase_call(
-                lambda: supabase.table("withdrawals").select("*").eq("shift_id", shift_id).execute()
-            )
-            if not err and wd_res.data:
-                df_wd = pd.DataFrame(wd_res.data)
-                st.dataframe(df_wd[['amount', 'description']], use_container_width=True)
+            withdrawals_section(shift_id, df_wd)
 
             st.markdown("---")
 
@@ -657,13 +809,23 @@ elif st.session_state.page == "📝 Shift Recording":
             st.subheader("Close Shift")
             expected = calculate_expected_cash(shift_id)
             st.metric("Expected Cash", f"₹{expected:,.2f}")
+            # Staged rows are not in the database yet, so expected cash leaves them out
+            unsaved = sum(len(st.session_state[key]) for key in STAGED_ROW_KEYS)
+            if unsaved:
+                st.warning(f"{unsaved} staged row(s) not saved yet. Save or discard them before closing the shift.")
             closing = st.number_input("Enter Closing Cash", min_value=0.0, step=100.0)
-            if st.button("Close Shift"):
-                if closing >= 0:
-                    close_shift(shift_id, closing)
-                    st.success("Shift closed!")
-                    st.session_state.current_shift_id = None
-                    st.rerun()
+            # Sections stage rows in fragment reruns, so the count above can lag behind;
+            # the click reruns the whole page and is checked again here
+            if st.button("Close Shift", disabled=bool(unsaved)):
+                if unsaved:
+                    st.error("Save or discard the staged rows before closing the shift.")
+                elif closing >= 0:
+                    if close_shift(shift_id, closing):
+                        # close_shift recomputed and stored expected cash itself
+                        st.session_state.expected_dirty.discard(shift_id)
+                        st.success("Shift closed!")
+                        st.session_state.current_shift_id = None
+                        st.rerun()
                 else:
                     st.error("Invalid amount")
 
@@ -679,19 +841,24 @@ elif st.session_state.page == "📈 Reports":
         start_date = st.date_input("Start Date", value=date.today().replace(day=1))
     with col2:
         end_date = st.date_input("End Date", value=date.today())
+    start_iso, end_iso = start_date.isoformat(), end_date.isoformat()
     search_term = st.text_input("🔍 Search (applies to all text columns)")
 
     def filter_df(df, search):
         if search and not df.empty:
-            mask = df.astype(str).apply(lambda x: x.str.contains(search, case=False, na=False)).any(axis=1)
-            return df[mask]
+            # Join each row's cells once and run a single Arrow substring search over the result
+            cells = df.astype(object).fillna("").astype(str)
+            joined = cells.iloc[:, 0].str.cat([cells[c] for c in cells.columns[1:]], sep="\x1f")
+            mask = joined.astype("string[pyarrow]").str.contains(search, case=False, regex=False)
+            return df[mask.to_numpy(dtype=bool)]
         return df
 
     # Get shifts in date range
     shifts_res, err, msg = safe_supabase_call(
-        lambda: supabase.table("shifts").select("id, date, shift_name")
-                .gte("date", start_date.isoformat())
-                .lte("date", end_date.isoformat())
+        lambda: supabase.table("shifts").select("id, date, shift_name, total_sale")
+                .gte("date", start_iso)
+                .lte("date", end_iso)
+                .order("date")
                 .execute()
     )
     if err:
@@ -700,97 +867,85 @@ elif st.session_state.page == "📈 Reports":
     shift_ids = [s['id'] for s in shifts_res.data] if shifts_res.data else []
 
     # -------------------- Expense Reports --------------------
-    if report_type in ["Expense Head Wise", "All Expenses"]:
+    if report_type == "Expense Head Wise":
         if not shift_ids:
             st.info("No shifts in selected range")
         else:
-            exp_res, err, msg = safe_supabase_call(
-                lambda: supabase.table("expenses")
-                .select("*, expense_heads(name), shifts(date, shift_name)")
-                .in_("shift_id", shift_ids)
-                .execute()
+            # Grouped in Postgres: one (head, amount) row per expense head
+            sum_res, err, msg = safe_supabase_call(
+                lambda: supabase.rpc("expense_head_totals", {"p_start": start_iso, "p_end": end_iso}).execute()
             )
             if err:
                 st.error(f"Failed to fetch expenses: {msg}")
-            elif exp_res.data:
-                df = pd.DataFrame(exp_res.data)
-                df['head'] = df['expense_heads'].apply(lambda x: x['name'])
-                df['date'] = df['shifts'].apply(lambda x: x['date'])
-                df['shift'] = df['shifts'].apply(lambda x: x['shift_name'])
-                df = df[['date', 'shift', 'head', 'amount', 'source', 'description']]
-
-                if report_type == "Expense Head Wise":
-                    summary = df.groupby('head')['amount'].sum().reset_index()
-                    fig = px.bar(summary, x='head', y='amount', title="Expenses by Head")
-                    st.plotly_chart(fig)
-                    st.dataframe(summary, use_container_width=True)
-                    # PDF
-                    if st.button("Download PDF (Expense Head Wise)"):
-                        pdf_bytes = generate_pdf("Expense Head Wise", summary, ['head', 'amount'])
-                        b64 = base64.b64encode(pdf_bytes).decode()
-                        href = f'<a href="data:application/octet-stream;base64,{b64}" download="expense_head_wise.pdf">Download PDF</a>'
-                        st.markdown(href, unsafe_allow_html=True)
-                else:
-                    df_filtered = filter_df(df, search_term)
-                    st.dataframe(df_filtered, use_container_width=True)
-                    # PDF with totals
-                    if st.button("Download PDF (All Expenses)"):
-                        total = df['amount'].sum()
-                        totals_row = {'date': '', 'shift': '', 'head': 'TOTAL', 'amount': total, 'source': '', 'description': ''}
-                        pdf_bytes = generate_pdf("All Expenses", df_filtered, df.columns.tolist(), totals_row)
-                        b64 = base64.b64encode(pdf_bytes).decode()
-                        href = f'<a href="data:application/octet-stream;base64,{b64}" download="all_expenses.pdf">Download PDF</a>'
-                        st.markdown(href, unsafe_allow_html=True)
+            elif sum_res.data:
+                summary = pd.DataFrame(sum_res.data, columns=['head', 'amount'])
+                fig = px.bar(summary, x='head', y='amount', title="Expenses by Head")
+                st.plotly_chart(fig)
+                st.dataframe(summary, use_container_width=True)
+                # PDF
+                pdf_download_button("Download PDF (Expense Head Wise)", "expense_head_wise.pdf", "Expense Head Wise", summary, ['head', 'amount'])
             else:
                 st.info("No expenses found")
 
+    elif report_type == "All Expenses":
+        exp_res, err, msg = safe_supabase_call(
+            lambda: supabase.table("v_expenses_flat")
+            .select("date, shift, head, amount, source, description")
+            .gte("date", start_iso)
+            .lte("date", end_iso)
+            .order("date")
+            .execute()
+        )
+        if err:
+            st.error(f"Failed to fetch expenses: {msg}")
+        elif exp_res.data:
+            df = pd.DataFrame(exp_res.data, columns=['date', 'shift', 'head', 'amount', 'source', 'description'])
+            df = df.astype({'shift': 'category', 'head': 'category', 'source': 'category'})
+
+            df_filtered = filter_df(df, search_term)
+            show_paginated_dataframe(df_filtered, "page_all_expenses")
+            # PDF with totals
+            total = df['amount'].sum()
+            totals_row = {'date': '', 'shift': '', 'head': 'TOTAL', 'amount': total, 'source': '', 'description': ''}
+            pdf_download_button("Download PDF (All Expenses)", "all_expenses.pdf", "All Expenses", df_filtered, df.columns.tolist(), totals_row)
+        else:
+            st.info("No expenses found")
+
     # -------------------- Sales Summary --------------------
     elif report_type == "Sales Summary":
         if shifts_res.data:
             df = pd.DataFrame(shifts_res.data)
-            df['date'] = pd.to_datetime(df['date'])
-            df = df.sort_values('date')
+            # Rows arrive ordered by date; plotly reads the ISO date strings directly
+            df['shift_name'] = df['shift_name'].astype('category')
             fig = px.line(df, x='date', y='total_sale', color='shift_name', title="Daily Sales by Shift")
             st.plotly_chart(fig)
-            st.dataframe(df, use_container_width=True)
-            if st.button("Download PDF (Sales Summary)"):
-                pdf_bytes = generate_pdf("Sales Summary", df, ['date', 'shift_name', 'total_sale'])
-                b64 = base64.b64encode(pdf_bytes).decode()
-                href = f'<a href="data:application/octet-stream;base64,{b64}" download="sales_summary.pdf">Download PDF</a>'
-                st.markdown(href, unsafe_allow_html=True)
+            show_paginated_dataframe(df, "page_sales_summary")
+            pdf_download_button("Download PDF (Sales Summary)", "sales_summary.pdf", "Sales Summary", df, ['date', 'shift_name', 'total_sale'])
         else:
             st.info("No sales data")
 
     # -------------------- Shift Wise Summary --------------------
     elif report_type == "Shift Wise Summary":
+        # The only report that reads stored expected cash; refresh it before reading
+        refresh_expected_cash(start_date, end_date)
         if shift_ids:
             full = []
             for sid in shift_ids:
-                s_res, err, msg = safe_supabase_call(
-                    lambda sid=sid: supabase.table("shifts").select("*").eq("id", sid).execute()
+                (s_res, err, msg), (exp_res, _, _), (wd_res, _, _), (pay_res, _, _), (pur_res, _, _) = safe_supabase_calls_parallel(
+                    lambda: supabase.table("shifts")
+                    .select("date, shift_name, opening_cash, total_sale, expected_cash, closing_cash_entered")
+                    .eq("id", sid).execute(),
+                    lambda: supabase.table("expenses").select("amount").eq("shift_id", sid).execute(),
+                    lambda: supabase.table("withdrawals").select("amount").eq("shift_id", sid).execute(),
+                    lambda: supabase.table("vendor_payments").select("amount").eq("shift_id", sid).execute(),
+                    lambda: supabase.table("purchases").select("amount").eq("shift_id", sid).execute()
                 )
                 if not err and s_res.data:
                     shift = s_res.data[0]
-                    # Fetch totals for this shift
-                    exp_res, _, _ = safe_supabase_call(
-                        lambda: supabase.table("expenses").select("amount").eq("shift_id", sid).execute()
-                    )
-                    total_exp = sum([e['amount'] for e in exp_res.data]) if exp_res.data else 0
-
-                    wd_res, _, _ = safe_supabase_call(
-                        lambda: supabase.table("withdrawals").select("amount").eq("shift_id", sid).execute()
-                    )
-                    total_wd = sum([w['amount'] for w in wd_res.data]) if wd_res.data else 0
-
-                    pay_res, _, _ = safe_supabase_call(
-                        lambda: supabase.table("vendor_payments").select("amount").eq("shift_id", sid).execute()
-                    )
-                    total_pay = sum([p['amount'] for p in pay_res.data]) if pay_res.data else 0
-
-                    pur_res, _, _ = safe_supabase_call(
-                        lambda: supabase.table("purchases").select("amount").eq("shift_id", sid).execute()
-                    )
-                    total_pur = sum([p['amount'] for p in pur_res.data]) if pur_res.data else 0
+                    total_exp = sum(e['amount'] for e in exp_res.data) if exp_res else 0
+                    total_wd = sum(w['amount'] for w in wd_res.data) if wd_res else 0
+                    total_pay = sum(p['amount'] for p in pay_res.data) if pay_res else 0
+                    total_pur = sum(p['amount'] for p in pur_res.data) if pur_res else 0
 
                     full.append({
                         "Date": shift['date'],
@@ -807,12 +962,8 @@ elif st.session_state.page == "📈 Reports":
             if full:
                 df = pd.DataFrame(full)
                 df_filtered = filter_df(df, search_term)
-                st.dataframe(df_filtered, use_container_width=True)
-                if st.button("Download PDF (Shift Wise)"):
-                    pdf_bytes = generate_pdf("Shift Wise Summary", df_filtered, df.columns.tolist())
-                    b64 = base64.b64encode(pdf_bytes).decode()
-                    href = f'<a href="data:application/octet-stream;base64,{b64}" download="shift_wise.pdf">Download PDF</a>'
-                    st.markdown(href, unsafe_allow_html=True)
+                show_paginated_dataframe(df_filtered, "page_shift_wise")
+                pdf_download_button("Download PDF (Shift Wise)", "shift_wise.pdf", "Shift Wise Summary", df_filtered, df.columns.tolist())
             else:
                 st.info("No shift details")
         else:
@@ -820,30 +971,13 @@ elif st.session_state.page == "📈 Reports":
 
     # -------------------- Owner Transactions --------------------
     elif report_type == "Owner Transactions":
-        own_res, err, msg = safe_supabase_call(
-            lambda: supabase.table("owner_ledger")
-            .select("*")
-            .gte("transaction_date", start_date.isoformat())
-            .lte("transaction_date", end_date.isoformat())
-            .order("transaction_date")
-            .execute()
-        )
+        df, err, msg = safe_supabase_call(_load_owner_ledger, start_iso, end_iso)
         if err:
             st.error(f"Failed: {msg}")
-        elif own_res.data:
-            df = pd.DataFrame(own_res.data)
-            df['type'] = df['amount'].apply(lambda x: "Investment" if x > 0 else "Withdrawal")
-            df['amount_abs'] = df['amount'].abs()
-            df['running_balance'] = df['amount'].cumsum()
-            df = df[['transaction_date', 'type', 'amount_abs', 'description', 'running_balance']]
-            df.columns = ['Date', 'Type', 'Amount', 'Description', 'Balance']
+        elif not df.empty:
             df_filtered = filter_df(df, search_term)
-            st.dataframe(df_filtered, use_container_width=True)
-            if st.button("Download PDF (Owner Transactions)"):
-                pdf_bytes = generate_pdf("Owner Transactions", df_filtered, df.columns.tolist())
-                b64 = base64.b64encode(pdf_bytes).decode()
-                href = f'<a href="data:application/octet-stream;base64,{b64}" download="owner_transactions.pdf">Download PDF</a>'
-                st.markdown(href, unsafe_allow_html=True)
+            show_paginated_dataframe(df_filtered, "page_owner_tx")
+            pdf_download_button("Download PDF (Owner Transactions)", "owner_transactions.pdf", "Owner Transactions", df_filtered, df.columns.tolist())
         else:
             st.info("No owner transactions")
 
@@ -852,7 +986,7 @@ elif st.session_state.page == "📈 Reports":
         if shift_ids:
             pay_res, err, msg = safe_supabase_call(
                 lambda: supabase.table("vendor_payments")
-                .select("*, vendors(name), shifts(date, shift_name)")
+                .select("amount, source, description, vendors(name), shifts(date, shift_name)")
                 .in_("shift_id", shift_ids)
                 .execute()
             )
@@ -860,19 +994,16 @@ elif st.session_state.page == "📈 Reports":
                 st.error(f"Failed: {msg}")
             elif pay_res.data:
                 df = pd.DataFrame(pay_res.data)
-                df['vendor'] = df['vendors'].apply(lambda x: x['name'])
-                df['date'] = df['shifts'].apply(lambda x: x['date'])
-                df['shift'] = df['shifts'].apply(lambda x: x['shift_name'])
+                df['vendor'] = [x['name'] if x else None for x in df['vendors']]
+                df['date'] = [x['date'] if x else None for x in df['shifts']]
+                df['shift'] = [x['shift_name'] if x else None for x in df['shifts']]
                 df = df[['date', 'shift', 'vendor', 'amount', 'source', 'description']]
+                df = df.astype({'shift': 'category', 'vendor': 'category', 'source': 'category'})
                 df_filtered = filter_df(df, search_term)
-                st.dataframe(df_filtered, use_container_width=True)
-                if st.button("Download PDF (Vendor Payments)"):
-                    total = df['amount'].sum()
-                    totals_row = {'date': '', 'shift': '', 'vendor': 'TOTAL', 'amount': total, 'source': '', 'description': ''}
-                    pdf_bytes = generate_pdf("Vendor Payments", df_filtered, df.columns.tolist(), totals_row)
-                    b64 = base64.b64encode(pdf_bytes).decode()
-                    href = f'<a href="data:application/octet-stream;base64,{b64}" download="vendor_payments.pdf">Download PDF</a>'
-                    st.markdown(href, unsafe_allow_html=True)
+                show_paginated_dataframe(df_filtered, "page_vendor_payments")
+                total = df['amount'].sum()
+                totals_row = {'date': '', 'shift': '', 'vendor': 'TOTAL', 'amount': total, 'source': '', 'description': ''}
+                pdf_download_button("Download PDF (Vendor Payments)", "vendor_payments.pdf", "Vendor Payments", df_filtered, df.columns.tolist(), totals_row)
             else:
                 st.info("No payments")
         else:
@@ -884,107 +1015,32 @@ elif st.session_state.page == "📈 Reports":
         if not vendors_df.empty:
             vendor_options = {row['name']: row['id'] for _, row in vendors_df.iterrows()}
             vendor = st.selectbox("Select Vendor", list(vendor_options.keys()))
+            # Cash purchases don't change the balance; leave them out unless asked for
+            include_cash = st.checkbox("Include cash purchases", value=False)
             if st.button("Generate Ledger"):
+                st.session_state.ledger_vendor = vendor
+            # Keep the ledger on screen across reruns (e.g. paging) until another vendor is picked
+            if st.session_state.get('ledger_vendor') == vendor:
                 vendor_id = vendor_options[vendor]
-                # Get opening balance
-                ven_res, err, msg = safe_supabase_call(
-                    lambda: supabase.table("vendors").select("opening_balance").eq("id", vendor_id).execute()
-                )
-                if err or not ven_res.data:
+                # Opening row, detail rows and running balance all come from one RPC
+                led_rows, err, msg = safe_supabase_call(_load_vendor_ledger, vendor_id, start_iso, end_iso, include_cash)
+                if err:
+                    st.error(f"Failed to fetch ledger: {msg}")
+                elif not led_rows:
                     st.error("Vendor not found")
                 else:
-                    opening = ven_res.data[0]['opening_balance'] or 0
-                    # Fetch transactions
-                    pur_res, err, msg = safe_supabase_call(
-                        lambda: supabase.table("purchases").select("amount, payment_type, created_at, description")
-                        .eq("vendor_id", vendor_id)
-                        .gte("created_at", start_date.isoformat())
-                        .lte("created_at", end_date.isoformat())
-                        .execute()
-                    )
-                    pay_res, err2, msg2 = safe_supabase_call(
-                        lambda: supabase.table("vendor_payments").select("amount, source, created_at, description")
-                        .eq("vendor_id", vendor_id)
-                        .gte("created_at", start_date.isoformat())
-                        .lte("created_at", end_date.isoformat())
-                        .execute()
-                    )
-                    ret_res, err3, msg3 = safe_supabase_call(
-                        lambda: supabase.table("returns").select("amount, created_at, description")
-                        .eq("vendor_id", vendor_id)
-                        .gte("created_at", start_date.isoformat())
-                        .lte("created_at", end_date.isoformat())
-                        .execute()
-                    )
-                    ledger = []
-                    balance = opening
-                    # Opening row
-                    ledger.append({
-                        "Date": start_date.isoformat(),
-                        "Transaction Type": "Opening",
-                        "Debit": 0,
-                        "Credit": 0,
-                        "Balance": balance,
-                        "Payment Mode": "",
-                        "Description": "Opening Balance"
+                    tx = pd.DataFrame.from_records(led_rows, columns=_LEDGER_COLS).astype(_LEDGER_DTYPES)
+                    df = pd.DataFrame({
+                        "Date": tx['tx_date'].str[:10].astype('string[pyarrow]'),
+                        "Transaction Type": tx['tx_type'],
+                        "Debit": tx['debit'],
+                        "Credit": tx['credit'],
+                        "Balance": tx['balance'],
+                        "Payment Mode": tx['payment_mode'],
+                        "Description": tx['description']
                     })
-                    for p in pur_res.data if pur_res.data else []:
-                        if p['payment_type'] == 'credit':
-                            balance += p['amount']
-                            ledger.append({
-                                "Date": p['created_at'][:10],
-                                "Transaction Type": "Purchase",
-                                "Debit": p['amount'],
-                                "Credit": 0,
-                                "Balance": balance,
-                                "Payment Mode": "Credit",
-                                "Description": p.get('description','')
-                            })
-                        else:
-                            # Cash purchase does not affect ledger balance, but we may show for info
-                            ledger.append({
-                                "Date": p['created_at'][:10],
-                                "Transaction Type": "Purchase",
-                                "Debit": 0,
-                                "Credit": 0,
-                                "Balance": balance,
-                                "Payment Mode": "Cash",
-                                "Description": p.get('description','') + " (cash)"
-                            })
-                    for p in pay_res.data if pay_res.data else []:
-                        balance -= p['amount']
-                        mode = "Cash" if p['source'] == "sales_cash" else "Owner Pocket"
-                        ledger.append({
-                            "Date": p['created_at'][:10],
-                            "Transaction Type": "Payment",
-                            "Debit": 0,
-                            "Credit": p['amount'],
-                            "Balance": balance,
-                            "Payment Mode": mode,
-                            "Description": p.get('description','')
-                        })
-                    for r in ret_res.data if ret_res.data else []:
-                        balance -= r['amount']
-                        ledger.append({
-                            "Date": r['created_at'][:10],
-                            "Transaction Type": "Return",
-                            "Debit": 0,
-                            "Credit": r['amount'],
-                            "Balance": balance,
-                            "Payment Mode": "N/A",
-                            "Description": r.get('description','')
-                        })
-                    df = pd.DataFrame(ledger)
-                    if not df.empty:
-                        df = df.sort_values('Date')
-                        st.dataframe(df, use_container_width=True)
-                        if st.button("Download PDF (Vendor Ledger)"):
-                            pdf_bytes = generate_pdf(f"Vendor Ledger: {vendor}", df, df.columns.tolist())
-                            b64 = base64.b64encode(pdf_bytes).decode()
-                            href = f'<a href="data:application/octet-stream;base64,{b64}" download="vendor_ledger.pdf">Download PDF</a>'
-                            st.markdown(href, unsafe_allow_html=True)
-                    else:
-                        st.info("No transactions")
+                    show_paginated_dataframe(df, "page_vendor_ledger")
+                    pdf_download_button("Download PDF (Vendor Ledger)", "vendor_ledger.pdf", f"Vendor Ledger: {vendor}", df, df.columns.tolist())
         else:
             st.info("No vendors available")
 
@@ -993,28 +1049,18 @@ elif st.session_state.page == "📈 Reports":
         if not shift_ids:
             st.info("No shifts in selected range")
         else:
-            # Calculate totals
-            # Sales
-            sales = sum([s['total_sale'] for s in shifts_res.data]) if shifts_res.data else 0
-
-            # Purchases (COGS) – we assume purchases are cost of goods sold; returns reduce COGS
-            pur_res, err, msg = safe_supabase_call(
-                lambda: supabase.table("purchases").select("amount").in_("shift_id", shift_ids).execute()
-            )
-            total_purchases = sum([p['amount'] for p in pur_res.data]) if not err and pur_res.data else 0
-
-            ret_res, err, msg = safe_supabase_call(
-                lambda: supabase.table("returns").select("amount").in_("shift_id", shift_ids).execute()
+            # Totals are aggregated in Postgres; only four scalars come back
+            totals_res, err, msg = safe_supabase_call(
+                lambda: supabase.rpc("profit_loss_totals", {"p_start": start_iso, "p_end": end_iso}).execute()
             )
-            total_returns = sum([r['amount'] for r in ret_res.data]) if not err and ret_res.data else 0
-
-            cogs = total_purchases - total_returns
-
-            # Expenses
-            exp_res, err, msg = safe_supabase_call(
-                lambda: supabase.table("expenses").select("amount").in_("shift_id", shift_ids).execute()
-            )
-            total_expenses = sum([e['amount'] for e in exp_res.data]) if not err and exp_res.data else 0
+            if err or not totals_res.data:
+                st.error(f"Failed to calculate totals: {msg}")
+                st.stop()
+            totals = totals_res.data[0]
+            sales = totals['total_sales'] or 0
+            # Purchases (COGS) – we assume purchases are cost of goods sold; returns reduce COGS
+            cogs = (totals['total_purchases'] or 0) - (totals['total_returns'] or 0)
+            total_expenses = totals['total_expenses'] or 0
 
             gross_profit = sales - cogs
             net_profit = gross_profit - total_expenses
@@ -1028,15 +1074,10 @@ elif st.session_state.page == "📈 Reports":
             cole.metric("Net Profit", f"₹{net_profit:,.2f}")
 
             # Create a summary dataframe
-            pl_data = {
+            df_pl = pd.DataFrame({
                 "Particulars": ["Sales", "Less: COGS (Purchases - Returns)", "Gross Profit", "Less: Expenses", "Net Profit"],
                 "Amount": [sales, cogs, gross_profit, total_expenses, net_profit]
-            }
-            df_pl = pd.DataFrame(pl_data)
+            })
             st.dataframe(df_pl, use_container_width=True)
 
-            if st.button("Download PDF (P&L)"):
-                pdf_bytes = generate_pdf("Profit & Loss Statement", df_pl, ["Particulars", "Amount"])
-                b64 = base64.b64encode(pdf_bytes).decode()
-                href = f'<a href="data:application/octet-stream;base64,{b64}" download="profit_loss.pdf">Download PDF</a>'
-                st.markdown(href, unsafe_allow_html=True)
+            pdf_download_button("Download PDF (P&L)", "profit_loss.pdf", "Profit & Loss Statement", df_pl, ["Particulars", "Amount"])
@@ -0,0 +1,3 @@
+-- Every report starts with a date-range scan over shifts; index it so those
+-- scans don't degrade into sequential scans as the table grows.
+CREATE INDEX IF NOT EXISTS idx_shifts_date ON public.shifts (date);
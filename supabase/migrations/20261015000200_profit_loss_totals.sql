@@ -0,0 +1,21 @@
+-- Profit & Loss only needs four sums over the shifts in the selected range;
+-- aggregate them here instead of shipping every row to the client.
+CREATE OR REPLACE FUNCTION public.profit_loss_totals(p_start date, p_end date)
+RETURNS TABLE (
+    total_sales numeric,
+    total_purchases numeric,
+    total_returns numeric,
+    total_expenses numeric
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH s AS (
+        SELECT id, total_sale FROM public.shifts WHERE date BETWEEN p_start AND p_end
+    )
+    SELECT
+        COALESCE((SELECT SUM(total_sale) FROM s), 0),
+        COALESCE((SELECT SUM(amount) FROM public.purchases WHERE shift_id IN (SELECT id FROM s)), 0),
+        COALESCE((SELECT SUM(amount) FROM public.returns WHERE shift_id IN (SELECT id FROM s)), 0),
+        COALESCE((SELECT SUM(amount) FROM public.expenses WHERE shift_id IN (SELECT id FROM s)), 0);
+$$;
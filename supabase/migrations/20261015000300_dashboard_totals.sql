@@ -0,0 +1,16 @@
+-- Dashboard KPIs: expense, withdrawal and vendor payment totals for a set of
+-- shifts in one call instead of three row-level selects.
+CREATE OR REPLACE FUNCTION public.dashboard_totals(p_shift_ids uuid[])
+RETURNS TABLE (
+    total_expenses numeric,
+    total_withdrawals numeric,
+    total_payments numeric
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        COALESCE((SELECT SUM(amount) FROM public.expenses WHERE shift_id = ANY(p_shift_ids)), 0),
+        COALESCE((SELECT SUM(amount) FROM public.withdrawals WHERE shift_id = ANY(p_shift_ids)), 0),
+        COALESCE((SELECT SUM(amount) FROM public.vendor_payments WHERE shift_id = ANY(p_shift_ids)), 0);
+$$;
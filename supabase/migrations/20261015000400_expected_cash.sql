@@ -0,0 +1,32 @@
+-- Expected cash for a shift: opening cash + total sale minus everything paid
+-- out of sales cash (expenses, vendor payments, cash purchases) and owner
+-- withdrawals. Replaces five client-side queries with one call.
+CREATE OR REPLACE FUNCTION public.compute_expected_cash(p_shift_id uuid)
+RETURNS numeric
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(s.opening_cash, 0) + COALESCE(s.total_sale, 0)
+        - COALESCE((SELECT SUM(amount) FROM public.expenses
+                    WHERE shift_id = p_shift_id AND source = 'sales_cash'), 0)
+        - COALESCE((SELECT SUM(amount) FROM public.vendor_payments
+                    WHERE shift_id = p_shift_id AND source = 'sales_cash'), 0)
+        - COALESCE((SELECT SUM(amount) FROM public.purchases
+                    WHERE shift_id = p_shift_id AND payment_type = 'cash' AND source_if_cash = 'sales_cash'), 0)
+        - COALESCE((SELECT SUM(amount) FROM public.withdrawals
+                    WHERE shift_id = p_shift_id), 0)
+    FROM public.shifts s
+    WHERE s.id = p_shift_id;
+$$;
+
+-- Recompute and store expected_cash in a single statement.
+CREATE OR REPLACE FUNCTION public.update_expected_cash(p_shift_id uuid)
+RETURNS numeric
+LANGUAGE sql
+VOLATILE
+AS $$
+    UPDATE public.shifts
+    SET expected_cash = public.compute_expected_cash(id)
+    WHERE id = p_shift_id
+    RETURNING expected_cash;
+$$;
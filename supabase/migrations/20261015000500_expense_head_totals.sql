@@ -0,0 +1,14 @@
+-- Expense Head Wise report: totals per head for shifts in a date range.
+CREATE OR REPLACE FUNCTION public.expense_head_totals(p_start date, p_end date)
+RETURNS TABLE (head text, amount numeric)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT eh.name, SUM(e.amount)
+    FROM public.expenses e
+    JOIN public.expense_heads eh ON e.expense_head_id = eh.id
+    JOIN public.shifts s ON e.shift_id = s.id
+    WHERE s.date BETWEEN p_start AND p_end
+    GROUP BY eh.name
+    ORDER BY eh.name;
+$$;
@@ -0,0 +1,44 @@
+-- Vendor Ledger detail: credit/cash purchases, payments and returns for one
+-- vendor in a date range as a single date-ordered result. Debit/credit and
+-- payment mode are resolved here so the client only accumulates the balance.
+-- p_end is inclusive: rows are matched up to the end of that day.
+CREATE OR REPLACE FUNCTION public.vendor_ledger_rows(p_vendor uuid, p_start date, p_end date)
+RETURNS TABLE (
+    tx_date timestamptz,
+    tx_type text,
+    debit numeric,
+    credit numeric,
+    payment_mode text,
+    description text
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT created_at,
+           'Purchase',
+           CASE WHEN payment_type = 'credit' THEN amount ELSE 0 END,
+           0,
+           CASE WHEN payment_type = 'credit' THEN 'Credit' ELSE 'Cash' END,
+           COALESCE(description, '') || CASE WHEN payment_type = 'credit' THEN '' ELSE ' (cash)' END
+    FROM public.purchases
+    WHERE vendor_id = p_vendor AND created_at >= p_start AND created_at < p_end + 1
+    UNION ALL
+    SELECT created_at,
+           'Payment',
+           0,
+           amount,
+           CASE WHEN source = 'sales_cash' THEN 'Cash' ELSE 'Owner Pocket' END,
+           COALESCE(description, '')
+    FROM public.vendor_payments
+    WHERE vendor_id = p_vendor AND created_at >= p_start AND created_at < p_end + 1
+    UNION ALL
+    SELECT created_at,
+           'Return',
+           0,
+           amount,
+           'N/A',
+           COALESCE(description, '')
+    FROM public.returns
+    WHERE vendor_id = p_vendor AND created_at >= p_start AND created_at < p_end + 1
+    ORDER BY 1;
+$$;
@@ -0,0 +1,16 @@
+-- Child tables are always filtered by shift_id (and vendor_id for the ledger);
+-- without these indexes each lookup is a sequential scan.
+--
+-- Migrations run inside a transaction, so CONCURRENTLY is not used here. On a
+-- large live database run the same statements with CREATE INDEX CONCURRENTLY
+-- from the SQL editor first; IF NOT EXISTS then makes this file a no-op.
+CREATE INDEX IF NOT EXISTS idx_expenses_shift_id ON public.expenses (shift_id);
+CREATE INDEX IF NOT EXISTS idx_vendor_payments_shift_id ON public.vendor_payments (shift_id);
+CREATE INDEX IF NOT EXISTS idx_purchases_shift_vendor ON public.purchases (shift_id, vendor_id);
+CREATE INDEX IF NOT EXISTS idx_withdrawals_shift_id ON public.withdrawals (shift_id);
+CREATE INDEX IF NOT EXISTS idx_returns_shift_vendor ON public.returns (shift_id, vendor_id);
+
+-- One shift per (date, shift_name). Turns get_or_create_shift's existence
+-- check into an index lookup and lets it use INSERT ... ON CONFLICT.
+-- Fails if duplicate shifts already exist; merge those first.
+CREATE UNIQUE INDEX IF NOT EXISTS uq_shifts_date_shift_name ON public.shifts (date, shift_name);
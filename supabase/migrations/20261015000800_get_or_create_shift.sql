@@ -0,0 +1,24 @@
+-- Open a shift in one atomic statement: returns the existing shift's id, or
+-- creates it with opening cash carried over from the previous shift of the
+-- same day. Relies on uq_shifts_date_shift_name; the no-op DO UPDATE makes
+-- RETURNING yield the id on conflict as well.
+CREATE OR REPLACE FUNCTION public.get_or_create_shift(p_date date, p_shift_name text)
+RETURNS uuid
+LANGUAGE sql
+VOLATILE
+AS $$
+    INSERT INTO public.shifts (date, shift_name, opening_cash, total_sale, status)
+    SELECT p_date,
+           p_shift_name,
+           COALESCE((
+               SELECT COALESCE(NULLIF(expected_cash, 0), NULLIF(closing_cash_entered, 0), 0)
+               FROM public.shifts
+               WHERE date = p_date AND shift_name < p_shift_name
+               ORDER BY shift_name DESC
+               LIMIT 1
+           ), 0),
+           0,
+           'open'
+    ON CONFLICT (date, shift_name) DO UPDATE SET shift_name = EXCLUDED.shift_name
+    RETURNING id;
+$$;
@@ -0,0 +1,35 @@
+-- Close a shift in one transaction: compute expected cash, record a
+-- "Cash Shortage" expense if the counted cash is short, store the refreshed
+-- expected cash and mark the shift closed. Any failure rolls everything back.
+CREATE OR REPLACE FUNCTION public.close_shift(p_shift_id uuid, p_closing_cash numeric)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_expected numeric;
+    v_head uuid;
+BEGIN
+    PERFORM 1 FROM public.shifts WHERE id = p_shift_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Shift not found';
+    END IF;
+
+    v_expected := public.compute_expected_cash(p_shift_id);
+
+    IF p_closing_cash < v_expected THEN
+        SELECT id INTO v_head FROM public.expense_heads WHERE name = 'Cash Shortage' LIMIT 1;
+        IF v_head IS NULL THEN
+            RAISE EXCEPTION 'Cash Shortage head not found';
+        END IF;
+        INSERT INTO public.expenses (shift_id, expense_head_id, amount, source, description)
+        VALUES (p_shift_id, v_head, v_expected - p_closing_cash, 'sales_cash', 'Auto-recorded cash shortage');
+    END IF;
+
+    UPDATE public.shifts
+    SET expected_cash = public.compute_expected_cash(id),
+        closing_cash_entered = p_closing_cash,
+        status = 'closed',
+        closed_at = now()
+    WHERE id = p_shift_id;
+END;
+$$;
@@ -0,0 +1,14 @@
+-- All Expenses report: one flat row per expense with its shift and head.
+CREATE OR REPLACE VIEW public.v_expenses_flat
+WITH (security_invoker = true)
+AS
+SELECT e.id,
+       s.date,
+       s.shift_name AS shift,
+       eh.name AS head,
+       e.amount,
+       e.source,
+       e.description
+FROM public.expenses e
+JOIN public.shifts s ON e.shift_id = s.id
+LEFT JOIN public.expense_heads eh ON e.expense_head_id = eh.id;
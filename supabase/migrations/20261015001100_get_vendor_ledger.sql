@@ -0,0 +1,44 @@
+-- Vendor Ledger report: the opening row followed by the vendor_ledger_rows
+-- detail, with the running balance accumulated by a window function.
+CREATE OR REPLACE FUNCTION public.get_vendor_ledger(p_vendor uuid, p_start date, p_end date)
+RETURNS TABLE (
+    tx_date timestamptz,
+    tx_type text,
+    debit numeric,
+    credit numeric,
+    payment_mode text,
+    description text,
+    balance numeric
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH opening AS (
+        SELECT COALESCE(opening_balance, 0) AS amount
+        FROM public.vendors
+        WHERE id = p_vendor
+    ),
+    detail AS (
+        SELECT r.*, row_number() OVER (ORDER BY r.tx_date) AS seq
+        FROM public.vendor_ledger_rows(p_vendor, p_start, p_end) r
+    )
+    SELECT tx_date, tx_type, debit, credit, payment_mode, description, balance
+    FROM (
+        SELECT p_start::timestamptz AS tx_date,
+               'Opening' AS tx_type,
+               0::numeric AS debit,
+               0::numeric AS credit,
+               '' AS payment_mode,
+               'Opening Balance' AS description,
+               o.amount AS balance,
+               0::bigint AS seq
+        FROM opening o
+        UNION ALL
+        SELECT d.tx_date, d.tx_type, d.debit, d.credit, d.payment_mode, d.description,
+               o.amount + SUM(d.debit - d.credit) OVER (ORDER BY d.seq ROWS UNBOUNDED PRECEDING),
+               d.seq
+        FROM detail d
+        CROSS JOIN opening o
+    ) ledger
+    ORDER BY seq;
+$$;
@@ -0,0 +1,94 @@
+-- Cash purchases never move a vendor's balance, so the ledger leaves them out
+-- unless p_include_cash is set. Both functions gain the parameter; the old
+-- three-argument versions are dropped so calls are not ambiguous.
+DROP FUNCTION IF EXISTS public.get_vendor_ledger(uuid, date, date);
+DROP FUNCTION IF EXISTS public.vendor_ledger_rows(uuid, date, date);
+
+CREATE OR REPLACE FUNCTION public.vendor_ledger_rows(
+    p_vendor uuid, p_start date, p_end date, p_include_cash boolean DEFAULT false
+)
+RETURNS TABLE (
+    tx_date timestamptz,
+    tx_type text,
+    debit numeric,
+    credit numeric,
+    payment_mode text,
+    description text
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT created_at,
+           'Purchase',
+           CASE WHEN payment_type = 'credit' THEN amount ELSE 0 END,
+           0,
+           CASE WHEN payment_type = 'credit' THEN 'Credit' ELSE 'Cash' END,
+           COALESCE(description, '') || CASE WHEN payment_type = 'credit' THEN '' ELSE ' (cash)' END
+    FROM public.purchases
+    WHERE vendor_id = p_vendor AND created_at >= p_start AND created_at < p_end + 1
+      AND (p_include_cash OR payment_type = 'credit')
+    UNION ALL
+    SELECT created_at,
+           'Payment',
+           0,
+           amount,
+           CASE WHEN source = 'sales_cash' THEN 'Cash' ELSE 'Owner Pocket' END,
+           COALESCE(description, '')
+    FROM public.vendor_payments
+    WHERE vendor_id = p_vendor AND created_at >= p_start AND created_at < p_end + 1
+    UNION ALL
+    SELECT created_at,
+           'Return',
+           0,
+           amount,
+           'N/A',
+           COALESCE(description, '')
+    FROM public.returns
+    WHERE vendor_id = p_vendor AND created_at >= p_start AND created_at < p_end + 1
+    ORDER BY 1;
+$$;
+
+CREATE OR REPLACE FUNCTION public.get_vendor_ledger(
+    p_vendor uuid, p_start date, p_end date, p_include_cash boolean DEFAULT false
+)
+RETURNS TABLE (
+    tx_date timestamptz,
+    tx_type text,
+    debit numeric,
+    credit numeric,
+    payment_mode text,
+    description text,
+    balance numeric
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH opening AS (
+        SELECT COALESCE(opening_balance, 0) AS amount
+        FROM public.vendors
+        WHERE id = p_vendor
+    ),
+    detail AS (
+        SELECT r.*, row_number() OVER (ORDER BY r.tx_date) AS seq
+        FROM public.vendor_ledger_rows(p_vendor, p_start, p_end, p_include_cash) r
+    )
+    SELECT tx_date, tx_type, debit, credit, payment_mode, description, balance
+    FROM (
+        SELECT p_start::timestamptz AS tx_date,
+               'Opening' AS tx_type,
+               0::numeric AS debit,
+               0::numeric AS credit,
+               '' AS payment_mode,
+               'Opening Balance' AS description,
+               o.amount AS balance,
+               0::bigint AS seq
+        FROM opening o
+        UNION ALL
+        SELECT d.tx_date, d.tx_type, d.debit, d.credit, d.payment_mode, d.description,
+               o.amount + SUM(d.debit - d.credit) OVER (ORDER BY d.seq ROWS UNBOUNDED PRECEDING),
+               d.seq
+        FROM detail d
+        CROSS JOIN opening o
+    ) ledger
+    ORDER BY seq;
+$$;
@@ -0,0 +1,10 @@
+-- Owner Transactions scans owner_ledger by transaction_date; the vendor ledger
+-- scans purchases, vendor_payments and returns by vendor over a created_at
+-- range. These indexes serve both range scans in the order they are read.
+--
+-- As with the other index migrations, CONCURRENTLY is not used because
+-- migrations run inside a transaction.
+CREATE INDEX IF NOT EXISTS idx_owner_ledger_transaction_date ON public.owner_ledger (transaction_date);
+CREATE INDEX IF NOT EXISTS idx_purchases_vendor_created_at ON public.purchases (vendor_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_vendor_payments_vendor_created_at ON public.vendor_payments (vendor_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_returns_vendor_created_at ON public.returns (vendor_id, created_at);
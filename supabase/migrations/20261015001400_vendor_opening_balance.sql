@@ -0,0 +1,66 @@
+-- Balance owed to a vendor at the start of p_as_of: the vendor's opening
+-- balance plus credit purchases, less payments and returns, before that day.
+-- Each term is a single aggregate over the (vendor_id, created_at) indexes.
+CREATE OR REPLACE FUNCTION public.vendor_opening_balance(p_vendor uuid, p_as_of date)
+RETURNS numeric
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(v.opening_balance, 0)
+         + COALESCE((SELECT SUM(amount) FROM public.purchases
+                     WHERE vendor_id = p_vendor AND payment_type = 'credit' AND created_at < p_as_of), 0)
+         - COALESCE((SELECT SUM(amount) FROM public.vendor_payments
+                     WHERE vendor_id = p_vendor AND created_at < p_as_of), 0)
+         - COALESCE((SELECT SUM(amount) FROM public.returns
+                     WHERE vendor_id = p_vendor AND created_at < p_as_of), 0)
+    FROM public.vendors v
+    WHERE v.id = p_vendor;
+$$;
+
+-- The ledger's opening row now carries the balance as of p_start rather than
+-- the vendor's original opening balance, so activity before the report window
+-- is no longer dropped from the running balance.
+CREATE OR REPLACE FUNCTION public.get_vendor_ledger(
+    p_vendor uuid, p_start date, p_end date, p_include_cash boolean DEFAULT false
+)
+RETURNS TABLE (
+    tx_date timestamptz,
+    tx_type text,
+    debit numeric,
+    credit numeric,
+    payment_mode text,
+    description text,
+    balance numeric
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH opening AS (
+        SELECT public.vendor_opening_balance(p_vendor, p_start) AS amount
+        FROM public.vendors
+        WHERE id = p_vendor
+    ),
+    detail AS (
+        SELECT r.*, row_number() OVER (ORDER BY r.tx_date) AS seq
+        FROM public.vendor_ledger_rows(p_vendor, p_start, p_end, p_include_cash) r
+    )
+    SELECT tx_date, tx_type, debit, credit, payment_mode, description, balance
+    FROM (
+        SELECT p_start::timestamptz AS tx_date,
+               'Opening' AS tx_type,
+               0::numeric AS debit,
+               0::numeric AS credit,
+               '' AS payment_mode,
+               'Opening Balance' AS description,
+               o.amount AS balance,
+               0::bigint AS seq
+        FROM opening o
+        UNION ALL
+        SELECT d.tx_date, d.tx_type, d.debit, d.credit, d.payment_mode, d.description,
+               o.amount + SUM(d.debit - d.credit) OVER (ORDER BY d.seq ROWS UNBOUNDED PRECEDING),
+               d.seq
+        FROM detail d
+        CROSS JOIN opening o
+    ) ledger
+    ORDER BY seq;
+$$;
@@ -0,0 +1,38 @@
+-- Stored expected_cash is refreshed lazily per browser session, so another
+-- session may have left it stale. Opening the next shift now carries over the
+-- previous shift's live expected cash instead of the stored column.
+CREATE OR REPLACE FUNCTION public.get_or_create_shift(p_date date, p_shift_name text)
+RETURNS uuid
+LANGUAGE sql
+VOLATILE
+AS $$
+    INSERT INTO public.shifts (date, shift_name, opening_cash, total_sale, status)
+    SELECT p_date,
+           p_shift_name,
+           COALESCE((
+               SELECT COALESCE(NULLIF(public.compute_expected_cash(id), 0), NULLIF(closing_cash_entered, 0), 0)
+               FROM public.shifts
+               WHERE date = p_date AND shift_name < p_shift_name
+               ORDER BY shift_name DESC
+               LIMIT 1
+           ), 0),
+           0,
+           'open'
+    ON CONFLICT (date, shift_name) DO UPDATE SET shift_name = EXCLUDED.shift_name
+    RETURNING id;
+$$;
+
+-- Bring stored expected_cash up to date for the open shifts in a date range
+-- before Dashboard and Reports read it. Closed shifts were stored by
+-- close_shift and are left alone; unchanged rows are not rewritten.
+CREATE OR REPLACE FUNCTION public.refresh_expected_cash(p_start date, p_end date)
+RETURNS void
+LANGUAGE sql
+VOLATILE
+AS $$
+    UPDATE public.shifts
+    SET expected_cash = public.compute_expected_cash(id)
+    WHERE date BETWEEN p_start AND p_end
+      AND status = 'open'
+      AND expected_cash IS DISTINCT FROM public.compute_expected_cash(id);
+$$;